@@ -6,140 +6,337 @@ Enhanced for professional-grade performance analysis and visualization.
 from __future__ import annotations
 
 import json
-import random
+import multiprocessing
+import os
+import queue
 import socket
-import statistics
 import threading
 import time
-from typing import Callable, Dict, List, Optional
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
 
+import numpy as np
 from oqs import oqs
+from cryptography.hazmat.backends.openssl.backend import backend as openssl_backend
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import x25519
 
-from client_classical import ClassicalClient
+from client_classical import ClassicalClient, prefill_keypair_pool
 from client_pqc import PQCClient
+from common import (
+    KYBER768_CIPHERTEXT_BYTES,
+    KYBER768_PUBLIC_KEY_BYTES,
+    MLDSA65_PUBLIC_KEY_BYTES,
+    MLDSA65_SIGNATURE_BYTES,
+    X25519_PUBLIC_KEY_BYTES,
+)
 from server_classical import ClassicalServer
 from server_pqc import PQCServer
 
 ITERATIONS_PER_MODE = 50
+WARMUP_ITERATIONS = 5
+HANDSHAKE_THREADS_PER_MODE = 1
+MODE_LABELS = {'classical': "Classical", 'pqc': "PQC"}
+HYBRID_MODES = ("parallel", "sequential")
+
+# Sizes fixed by the algorithm parameter sets (shared with the wire format's
+# frame limits); set VERIFY_KEY_SIZES=1 to check them against real keys
+CLASSICAL_PUBLIC_KEY_BYTES = X25519_PUBLIC_KEY_BYTES
+
+# Mode workers are spawned rather than forked: forking a parent that already
+# runs threads (the dashboard's, a server's) can copy locks held mid-operation
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+# Progress queue of a mode worker process, set by _init_mode_worker
+_progress_queue: Optional[multiprocessing.Queue] = None
+
+
+def _apply_penalties_vec(
+    samples: np.ndarray,
+    latency_ms: float,
+    packet_loss_percent: float,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Apply latency and packet loss adjustments to a whole array of raw timings,
+    drawing retransmission jitter from rng.
+    """
+    adjusted = samples + max(latency_ms, 0.0)
+    if packet_loss_percent > 0.0:
+        adjusted *= 1.0 + (packet_loss_percent / 100.0)
+        adjusted += rng.uniform(
+            0.0, adjusted * (packet_loss_percent / 500.0), size=adjusted.shape
+        )
+    return adjusted
+
+
+def _combine_hybrid(
+    classical: np.ndarray, pqc: np.ndarray, hybrid_mode: str
+) -> np.ndarray:
+    """
+    Derive hybrid timings from classical and PQC timings of the same iterations;
+    sample i combines classical and PQC handshake i.
+    """
+    if hybrid_mode == "parallel":
+        # Both exchanges share one round trip; the slower one sets the pace
+        return np.maximum(classical, pqc)
+    return classical + pqc
+
+
+@contextmanager
+def _running_server(server_cls, loopback: bool = False) -> Iterator[Dict]:
+    """
+    Run one long-lived server for a whole benchmark mode.
+
+    Yields the keyword arguments the measure functions use to reach it: a TCP
+    port, or (for loopback) the server itself so each iteration can hand it one
+    end of a socketpair without any bind/listen/accept.
+    """
+    if loopback:
+        server = server_cls()
+        server.activate()
+        try:
+            yield {"server": server}
+        finally:
+            server.stop()
+        return
+
+    # Bind and listen here, so the server accepts connections (into its backlog)
+    # before the accept thread is even scheduled; port 0 picks a free port
+    server = server_cls(host="127.0.0.1", port=0)
+    server.listen()
+    server_thread = threading.Thread(target=server.start, daemon=True)
+    server_thread.start()
+
+    try:
+        yield {"port": server.port}
+    finally:
+        server.stop()
+        server_thread.join(timeout=2.0)
 
 
-def _get_free_port() -> int:
-    """Find an available port dynamically."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(('', 0))
-        s.listen(1)
-        port = s.getsockname()[1]
-    return port
+def _loopback_socket(server) -> socket.socket:
+    """Hand one end of a new socketpair to server and return the other end."""
+    # socketpair() is AF_UNIX where available, so no TCP state is set up at all
+    server_end, client_end = socket.socketpair()
+    server.serve_connection(server_end)
+    return client_end
 
 
-def _simulate_network_penalties(
-    elapsed_ms: float, latency_ms: float, packet_loss_percent: float
-) -> float:
-    """Apply latency and packet loss adjustments to raw timings."""
-    adjusted = elapsed_ms + max(latency_ms, 0.0)
-    if packet_loss_percent > 0.0:
-        adjusted *= 1.0 + (packet_loss_percent / 100.0)
-        jitter = adjusted * (packet_loss_percent / 500.0)
-        adjusted += random.uniform(0.0, jitter)
-    return adjusted
+def _make_client(client_cls, port: Optional[int] = None, server=None):
+    """Build a client for a TCP server port, or a socketpair loopback to a server."""
+    if port is not None:
+        return client_cls(host="127.0.0.1", port=port)
+    return client_cls(sock=_loopback_socket(server))
+
+
+@contextmanager
+def _thread_clients(client_cls, port: Optional[int] = None) -> Iterator[Callable]:
+    """
+    Yield a function returning the calling thread's client, built on first use,
+    so a mode creates one client per handshake thread instead of one per
+    iteration. Every client is closed on exit.
+    """
+    local = threading.local()
+    clients = []
+
+    def thread_client():
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = client_cls(host="127.0.0.1", port=port)
+            clients.append(client)
+        return client
+
+    try:
+        yield thread_client
+    finally:
+        for client in clients:
+            client.close()
 
 
 def measure_classical_handshake(
-    latency_ms: float = 0.0,
-    packet_loss_percent: float = 0.0,
     *,
-    port: int = None,
+    port: Optional[int] = None,
+    server=None,
 ) -> float:
-    """Measure a single classical ECDH handshake with network simulation."""
-    if port is None:
-        port = _get_free_port()
-    
-    server = ClassicalServer(host="0.0.0.0", port=port)
-    server_thread = threading.Thread(target=server.start, daemon=True)
-    server_thread.start()
-    time.sleep(0.1)  # Give server more time to start
-
-    client = ClassicalClient(host="127.0.0.1", port=port)
+    """Measure a single classical ECDH handshake against a running server."""
+    client = _make_client(ClassicalClient, port, server)
     try:
-        start_time = time.perf_counter()
+        start_ns = time.perf_counter_ns()
         if not client.connect():
             raise RuntimeError("Classical handshake failed to connect")
         client.disconnect()
-        elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+        elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
     finally:
         client.disconnect()
-        server.stop()
-        server_thread.join(timeout=2.0)
-        time.sleep(0.05)  # Brief pause between tests
 
-    return _simulate_network_penalties(elapsed_ms, latency_ms, packet_loss_percent)
+    return elapsed_ms
 
 
 def measure_pqc_handshake(
-    latency_ms: float = 0.0,
-    packet_loss_percent: float = 0.0,
     *,
-    port: int = None,
+    port: Optional[int] = None,
+    server=None,
+    client: Optional[PQCClient] = None,
 ) -> float:
-    """Measure a single PQC handshake (Kyber768 + ML-DSA-65) with network simulation."""
-    if port is None:
-        port = _get_free_port()
-    
-    server = PQCServer(host="0.0.0.0", port=port)
-    server_thread = threading.Thread(target=server.start, daemon=True)
-    server_thread.start()
-    time.sleep(0.1)  # Give server more time to start
-
-    client = PQCClient(host="127.0.0.1", port=port)
+    """
+    Measure a single PQC handshake (Kyber768 + ML-DSA-65) against a running server.
+    A client passed in is reused, keeping its liboqs contexts; otherwise one is
+    built and closed here.
+    """
+    owns_client = client is None
+    if owns_client:
+        client = PQCClient(host="127.0.0.1", port=port)
+    sock = _loopback_socket(server) if port is None else None
     try:
-        start_time = time.perf_counter()
-        if not client.connect():
+        start_ns = time.perf_counter_ns()
+        if not client.connect(sock):
             raise RuntimeError("PQC handshake failed to connect")
         client.disconnect()
-        elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+        elapsed_ms = (time.perf_counter_ns() - start_ns) / 1_000_000
     finally:
-        client.disconnect()
-        server.stop()
-        server_thread.join(timeout=2.0)
-        time.sleep(0.05)  # Brief pause between tests
+        if owns_client:
+            client.close()
+        else:
+            client.disconnect()
 
-    return _simulate_network_penalties(elapsed_ms, latency_ms, packet_loss_percent)
+    return elapsed_ms
 
 
-def measure_hybrid_handshake(
-    latency_ms: float = 0.0, 
-    packet_loss_percent: float = 0.0
-) -> float:
-    """Measure hybrid handshake (Classical + PQC sequential)."""
-    classical_time = measure_classical_handshake(latency_ms, packet_loss_percent)
-    pqc_time = measure_pqc_handshake(latency_ms, packet_loss_percent)
-    return classical_time + pqc_time
+def _run_mode(
+    label: str,
+    measure: Callable[[], float],
+    progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    threads: int = HANDSHAKE_THREADS_PER_MODE,
+) -> array:
+    """
+    Drive all iterations of one mode on a pool of threads and collect their timings.
+    samples[i] is the timing of the i-th submitted iteration, whatever order the
+    iterations finish in, so the classical and PQC runs pair up by index.
+    """
+    # Unboxed doubles, preallocated and filled by submission index
+    samples = array('d', [0.0]) * ITERATIONS_PER_MODE
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        # Warm caches, lazily initialized library state and the worker threads;
+        # these timings are discarded
+        for future in [pool.submit(measure) for _ in range(WARMUP_ITERATIONS)]:
+            future.result()
+
+        futures = {pool.submit(measure): index for index in range(ITERATIONS_PER_MODE)}
+        for completed, future in enumerate(as_completed(futures), start=1):
+            samples[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(label, completed, ITERATIONS_PER_MODE)
+    return samples
+
+
+def _available_cpus() -> int:
+    """Return how many CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _init_mode_worker(progress_queue: multiprocessing.Queue) -> None:
+    """Hand the parent's progress queue to a freshly started worker process."""
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _benchmark_mode(
+    mode: str,
+    loopback: bool,
+    cpu_id: Optional[int] = None,
+    threads: int = HANDSHAKE_THREADS_PER_MODE,
+) -> array:
+    """
+    Run every iteration of one mode in a worker process, against its own server,
+    on the given number of handshake threads.
+    If cpu_id is given, the worker is pinned to that CPU (Linux only).
+    """
+    if cpu_id is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu_id})
+
+    def report(*update):
+        _progress_queue.put(update)
+
+    if mode == 'classical':
+        # Client key generation happens up front, outside the timed handshakes
+        prefill_keypair_pool(WARMUP_ITERATIONS + ITERATIONS_PER_MODE)
+        with _running_server(ClassicalServer, loopback) as target:
+            return _run_mode(
+                MODE_LABELS[mode],
+                partial(measure_classical_handshake, **target),
+                report,
+                threads,
+            )
+
+    # Each handshake thread reuses one PQCClient, so liboqs contexts are created
+    # once per thread for the whole mode rather than once per iteration
+    with _running_server(PQCServer, loopback) as target, _thread_clients(
+        PQCClient, target.get("port")
+    ) as thread_client:
+        return _run_mode(
+            MODE_LABELS[mode],
+            lambda: measure_pqc_handshake(client=thread_client(), **target),
+            report,
+            threads,
+        )
+
+
+@lru_cache(maxsize=1)
+def _verify_key_sizes() -> None:
+    """Check the key size constants against freshly generated keys, once per process."""
+    private_key = x25519.X25519PrivateKey.generate()
+    classical_public_bytes = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw,
+    )
+    with oqs.KeyEncapsulation("Kyber768") as kem:
+        with oqs.Signature("ML-DSA-65") as sig:
+            kem_public_key = kem.generate_keypair()
+            ciphertext, _ = kem.encap_secret(kem_public_key)
+            sig_public_key = sig.generate_keypair()
+            signature = sig.sign(b"benchmark")
+
+    # These sizes are also the handshake's frame limits, so check them all
+    expected = (
+        CLASSICAL_PUBLIC_KEY_BYTES,
+        KYBER768_PUBLIC_KEY_BYTES,
+        KYBER768_CIPHERTEXT_BYTES,
+        MLDSA65_PUBLIC_KEY_BYTES,
+        MLDSA65_SIGNATURE_BYTES,
+    )
+    measured = (
+        len(classical_public_bytes),
+        len(kem_public_key),
+        len(ciphertext),
+        len(sig_public_key),
+        len(signature),
+    )
+    if measured != expected:
+        raise RuntimeError(
+            f"Key size constants {expected} do not match generated keys {measured}"
+        )
 
 
 def get_classical_key_size() -> int:
-    """Return size of a classical ECDH public key in bytes."""
-    private_key = ec.generate_private_key(ec.SECP384R1())
-    public_key = private_key.public_key()
-    public_bytes = public_key.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo,
-    )
-    return len(public_bytes)
+    """Return size of a classical X25519 public key (raw encoding) in bytes."""
+    if os.environ.get("VERIFY_KEY_SIZES"):
+        _verify_key_sizes()
+    return CLASSICAL_PUBLIC_KEY_BYTES
 
 
 def get_pqc_key_sizes() -> Dict[str, int]:
     """Return sizes of Kyber768 public key and ML-DSA-65 signature in bytes."""
-    with oqs.KeyEncapsulation("Kyber768") as kem:
-        with oqs.Signature("ML-DSA-65") as sig:
-            kem_public_key = kem.generate_keypair()
-            sig.generate_keypair()
-            dummy_message = b"benchmark"
-            signature = sig.sign(dummy_message)
+    if os.environ.get("VERIFY_KEY_SIZES"):
+        _verify_key_sizes()
     return {
-        "kem_public_key_bytes": len(kem_public_key),
-        "signature_bytes": len(signature),
+        "kem_public_key_bytes": KYBER768_PUBLIC_KEY_BYTES,
+        "signature_bytes": MLDSA65_SIGNATURE_BYTES,
     }
 
 
@@ -148,8 +345,39 @@ def run_all_benchmarks(
     latency_ms: float = 0.0,
     packet_loss_percent: float = 0.0,
     progress_callback: Optional[Callable[[str, int, int], None]] = None,
+    hybrid_mode: str = "parallel",
+    cpu_ids: Optional[Sequence[int]] = None,
+    handshake_threads: int = HANDSHAKE_THREADS_PER_MODE,
 ) -> Dict[str, Dict[str, float]]:
-    """Run comprehensive benchmarking suite with configurable modes."""
+    """
+    Run comprehensive benchmarking suite with configurable modes.
+
+    hybrid_mode selects how hybrid timings combine the two exchanges:
+    "parallel" (both run concurrently, as in deployed hybrid key exchange)
+    or "sequential" (one after the other).
+
+    cpu_ids optionally pins each mode's worker process to one of the given
+    CPUs, assigned in turn (Linux only). For stable numbers, use CPUs set
+    aside with isolcpus or `cset shield`. The client and server of a mode
+    then share one CPU, so pinned modes run one handshake at a time.
+
+    handshake_threads sets how many handshakes of a mode run at once. The
+    default of 1 times each handshake on its own; more threads measure
+    throughput under contention, as client, server and other handshakes then
+    compete for the same CPUs.
+    """
+    if hybrid_mode not in HYBRID_MODES:
+        raise ValueError(
+            f"hybrid_mode must be one of {HYBRID_MODES}, got {hybrid_mode!r}"
+        )
+    if handshake_threads < 1:
+        raise ValueError(
+            f"handshake_threads must be at least 1, got {handshake_threads!r}"
+        )
+    if cpu_ids and handshake_threads != 1:
+        raise ValueError(
+            "handshake_threads must be 1 when cpu_ids pins each mode to one CPU"
+        )
     if modes_to_run is None:
         modes_to_run = ['classical', 'pqc', 'hybrid']
     
@@ -157,28 +385,76 @@ def run_all_benchmarks(
     latency_ms = max(float(latency_ms), 0.0)
     packet_loss_percent = max(float(packet_loss_percent), 0.0)
 
-    samples: Dict[str, List[float]] = {}
-
-    if 'classical' in modes_to_run:
-        samples['classical'] = []
-        for iteration in range(1, ITERATIONS_PER_MODE + 1):
-            samples['classical'].append(measure_classical_handshake(latency_ms, packet_loss_percent))
-            if progress_callback:
-                progress_callback("Classical", iteration, ITERATIONS_PER_MODE)
-
-    if 'pqc' in modes_to_run:
-        samples['pqc'] = []
-        for iteration in range(1, ITERATIONS_PER_MODE + 1):
-            samples['pqc'].append(measure_pqc_handshake(latency_ms, packet_loss_percent))
-            if progress_callback:
-                progress_callback("PQC", iteration, ITERATIONS_PER_MODE)
-
+    # Raw handshake timings; network penalties are applied afterwards in one pass
+    samples: Dict[str, array] = {}
+
+    # Without simulated network conditions nothing needs a real TCP socket,
+    # so handshakes run over an in-process socketpair instead
+    loopback = latency_ms == 0.0 and packet_loss_percent == 0.0
+
+    # Hybrid samples are derived from the classical and PQC runs, so requesting
+    # hybrid measures both protocols without a separate set of handshakes
+    measured_modes = [
+        mode
+        for mode in MODE_LABELS
+        if mode in modes_to_run or 'hybrid' in modes_to_run
+    ]
+    # Modes run side by side only when each gets CPUs of its own: pinned to
+    # distinct CPUs, or with enough CPUs for every handshake thread. Otherwise
+    # they would time each other's work, so they run one after another
+    if cpu_ids:
+        parallel_modes = len(set(cpu_ids)) >= len(measured_modes)
+    else:
+        parallel_modes = _available_cpus() >= len(measured_modes) * handshake_threads
+
+    if measured_modes:
+        # Each mode runs in its own worker process; workers report progress
+        # through a queue drained here
+        progress_queue = _MP_CONTEXT.Queue()
+        with ProcessPoolExecutor(
+            max_workers=len(measured_modes) if parallel_modes else 1,
+            mp_context=_MP_CONTEXT,
+            initializer=_init_mode_worker,
+            initargs=(progress_queue,),
+        ) as pool:
+            futures = {
+                mode: pool.submit(
+                    _benchmark_mode,
+                    mode,
+                    loopback,
+                    cpu_ids[index % len(cpu_ids)] if cpu_ids else None,
+                    handshake_threads,
+                )
+                for index, mode in enumerate(measured_modes)
+            }
+
+            remaining_updates = ITERATIONS_PER_MODE * len(futures)
+            while remaining_updates:
+                try:
+                    update = progress_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if any(f.done() and f.exception() for f in futures.values()):
+                        break  # Surfaced by result() below
+                    continue
+                remaining_updates -= 1
+                if progress_callback:
+                    progress_callback(*update)
+
+            for mode, future in futures.items():
+                samples[mode] = future.result()
+
+    # One generator for all modes, drawing each mode's jitter in a single call
+    rng = np.random.default_rng()
+    penalized: Dict[str, np.ndarray] = {
+        mode: _apply_penalties_vec(
+            np.frombuffer(raw, dtype=np.float64), latency_ms, packet_loss_percent, rng
+        )
+        for mode, raw in samples.items()
+    }
     if 'hybrid' in modes_to_run:
-        samples['hybrid'] = []
-        for iteration in range(1, ITERATIONS_PER_MODE + 1):
-            samples['hybrid'].append(measure_hybrid_handshake(latency_ms, packet_loss_percent))
-            if progress_callback:
-                progress_callback("Hybrid", iteration, ITERATIONS_PER_MODE)
+        penalized['hybrid'] = _combine_hybrid(
+            penalized['classical'], penalized['pqc'], hybrid_mode
+        )
 
     classical_key_size = get_classical_key_size()
     pqc_sizes = get_pqc_key_sizes()
@@ -189,9 +465,22 @@ def run_all_benchmarks(
             "latency_ms": latency_ms,
             "packet_loss_percent": packet_loss_percent,
             "iterations": ITERATIONS_PER_MODE,
+            "hybrid_mode": hybrid_mode,
+            "transport": "socketpair" if loopback else "tcp",
+            "cpu_ids": list(cpu_ids) if cpu_ids else None,
+            "handshake_threads": handshake_threads,
+            "parallel_modes": parallel_modes,
+            "warmup_iterations": WARMUP_ITERATIONS,
+            "liboqs_version": oqs.oqs_version(),
+            # AES-GCM runs on OpenSSL's EVP implementation through cryptography
+            "openssl_version": openssl_backend.openssl_version_text(),
         },
         "handshake_time_ms": {},
-        "handshake_samples": samples,
+        "handshake_percentiles_ms": {},
+        # Per-iteration timings, in submission order for every mode
+        "handshake_samples": {
+            mode: penalized[mode].tolist() for mode in modes_to_run if mode in penalized
+        },
         "public_key_bytes": {
             "classical": classical_key_size,
             "pqc": pqc_sizes["kem_public_key_bytes"],
@@ -204,8 +493,14 @@ def run_all_benchmarks(
     }
     
     for mode in modes_to_run:
-        if mode in samples and samples[mode]:
-            results["handshake_time_ms"][mode] = statistics.mean(samples[mode])
+        if mode in penalized and penalized[mode].size:
+            results["handshake_time_ms"][mode] = float(penalized[mode].mean())
+            p50, p95, p99 = np.percentile(penalized[mode], (50, 95, 99))
+            results["handshake_percentiles_ms"][mode] = {
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+            }
     
     return results
 
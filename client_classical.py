@@ -1,24 +1,64 @@
-import os
+import logging
+import queue
 import socket
 
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import x25519
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
+from common import (
+    ConsoleFormatter,
+    MAX_MESSAGE_BYTES,
+    NONCE_PREFIX,
+    PACK_U32,
+    PACK_U64,
+    X25519_PUBLIC_KEY_BYTES,
+    receive_frame,
+)
+
+logger = logging.getLogger(__name__)
+
+# Pregenerated ephemeral (private_key, public_bytes) pairs, each used for exactly
+# one handshake. Only the benchmark fills it, so that its timings cover the key
+# exchange rather than key generation; when empty, keys are generated on demand.
+_KEYPAIR_POOL = queue.Queue()
+
+
+def _generate_keypair():
+    """
+    Generate an ephemeral X25519 key pair.
+    Returns the private key and its raw 32-byte public encoding.
+    """
+    private_key = x25519.X25519PrivateKey.generate()
+    public_bytes = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw,
+        format=serialization.PublicFormat.Raw,
+    )
+    return private_key, public_bytes
+
+
+def prefill_keypair_pool(count):
+    """
+    Pregenerate count ephemeral key pairs for upcoming handshakes.
+    """
+    for _ in range(count):
+        _KEYPAIR_POOL.put(_generate_keypair())
+
 
 class ClassicalClient:
     """
-    A secure TCP client implementing ECDH key exchange and AES-GCM encryption.
+    A secure TCP client implementing X25519 ECDH key exchange and AES-GCM encryption.
     Designed to work with ClassicalServer for secure message transmission.
     """
 
-    def __init__(self, host="localhost", port=12345):
+    def __init__(self, host="localhost", port=12345, sock=None):
         self.host = host
         self.port = port
-        self.client_socket = None
+        self.client_socket = sock  # Optional pre-connected socket (e.g. socketpair end)
         self.aesgcm = None
         self.connected = False
+        self._send_counter = 0
 
     def connect(self):
         """
@@ -26,10 +66,13 @@ class ClassicalClient:
         Returns True on success, False on failure.
         """
         try:
-            # Create socket and connect
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((self.host, self.port))
-            print(f"[CLIENT] Connected to {self.host}:{self.port}")
+            # Create socket and connect, unless a connected socket was supplied
+            if self.client_socket is None:
+                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # Don't let Nagle hold back small handshake frames
+                self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.client_socket.connect((self.host, self.port))
+                logger.debug("Connected to %s:%s", self.host, self.port)
 
             # Perform key exchange
             aes_key = self._perform_key_exchange()
@@ -39,12 +82,13 @@ class ClassicalClient:
 
             # Initialize AES-GCM cipher
             self.aesgcm = AESGCM(aes_key)
+            self._send_counter = 0  # Every handshake derives a fresh key
             self.connected = True
-            print("[CLIENT] Secure channel established")
+            logger.debug("Secure channel established")
             return True
 
         except Exception as e:
-            print(f"[CLIENT][ERROR] Connection failed: {e}")
+            logger.error("Connection failed: %s", e)
             self.disconnect()
             return False
 
@@ -55,38 +99,32 @@ class ClassicalClient:
         """
         try:
             # Receive server's public key
-            server_key_length_bytes = self._receive_exact(4)
-            if not server_key_length_bytes:
-                return None
-
-            server_key_length = int.from_bytes(server_key_length_bytes, byteorder="big")
-            server_public_bytes = self._receive_exact(server_key_length)
+            server_public_bytes = receive_frame(
+                self.client_socket, X25519_PUBLIC_KEY_BYTES
+            )
             if not server_public_bytes:
                 return None
 
-            print("[CLIENT] Received server public key")
+            logger.debug("Received server public key")
 
             # Deserialize server's public key
-            server_public_key = serialization.load_pem_public_key(server_public_bytes)
-
-            # Generate client's ECDH key pair
-            client_private_key = ec.generate_private_key(ec.SECP384R1())
-            client_public_key = client_private_key.public_key()
-
-            # Serialize client's public key
-            client_public_bytes = client_public_key.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+            server_public_key = x25519.X25519PublicKey.from_public_bytes(
+                server_public_bytes
             )
 
+            # Take a pregenerated X25519 key pair, or generate one
+            try:
+                client_private_key, client_public_bytes = _KEYPAIR_POOL.get_nowait()
+            except queue.Empty:
+                client_private_key, client_public_bytes = _generate_keypair()
+
             # Send client's public key (length + data)
             key_length = len(client_public_bytes)
-            self.client_socket.sendall(key_length.to_bytes(4, byteorder="big"))
-            self.client_socket.sendall(client_public_bytes)
-            print("[CLIENT] Sent public key")
+            self.client_socket.sendall(PACK_U32(key_length) + client_public_bytes)
+            logger.debug("Sent public key")
 
             # Compute shared secret
-            shared_secret = client_private_key.exchange(ec.ECDH(), server_public_key)
+            shared_secret = client_private_key.exchange(server_public_key)
 
             # Derive AES key using HKDF
             derived_key = HKDF(
@@ -96,11 +134,11 @@ class ClassicalClient:
                 info=b"handshake data",
             ).derive(shared_secret)
 
-            print("[CLIENT] Key exchange completed")
+            logger.debug("Key exchange completed")
             return derived_key
 
         except Exception as e:
-            print(f"[CLIENT][ERROR] Key exchange failed: {e}")
+            logger.error("Key exchange failed: %s", e)
             return None
 
     def send_message(self, message):
@@ -109,46 +147,38 @@ class ClassicalClient:
         Returns True on success, False on failure.
         """
         if not self.connected or not self.aesgcm:
-            print("[CLIENT][ERROR] Not connected to server")
+            logger.error("Not connected to server")
             return False
 
         try:
-            # Generate random nonce (96 bits for GCM)
-            nonce = os.urandom(12)
+            plaintext = message.encode("utf-8")
+            if len(plaintext) > MAX_MESSAGE_BYTES:
+                logger.error(
+                    "Message of %s bytes exceeds the %s-byte limit",
+                    len(plaintext),
+                    MAX_MESSAGE_BYTES,
+                )
+                return False
+
+            # Counter nonce (96 bits for GCM): unique under this connection's key,
+            # and the server checks it to reject replayed or reordered messages
+            nonce = NONCE_PREFIX + PACK_U64(self._send_counter)
+            self._send_counter += 1
 
             # Encrypt message
-            plaintext = message.encode("utf-8")
             ciphertext = self.aesgcm.encrypt(nonce, plaintext, None)
 
-            # Send message using protocol: nonce_length | nonce | ciphertext_length | ciphertext
-            nonce_length = len(nonce)
-            self.client_socket.sendall(nonce_length.to_bytes(4, byteorder="big"))
-            self.client_socket.sendall(nonce)
+            # Send message using protocol: ciphertext_length | nonce | ciphertext
+            # (one buffer, so the whole frame goes out in a single syscall)
+            self.client_socket.sendall(PACK_U32(len(ciphertext)) + nonce + ciphertext)
 
-            ciphertext_length = len(ciphertext)
-            self.client_socket.sendall(ciphertext_length.to_bytes(4, byteorder="big"))
-            self.client_socket.sendall(ciphertext)
-
-            print(f"[CLIENT] Sent encrypted message: {message}")
+            logger.debug("Sent encrypted message: %s", message)
             return True
 
         except Exception as e:
-            print(f"[CLIENT][ERROR] Failed to send message: {e}")
+            logger.error("Failed to send message: %s", e)
             return False
 
-    def _receive_exact(self, num_bytes):
-        """
-        Receive exactly num_bytes from the socket.
-        Returns the data or None if connection closed.
-        """
-        data = b""
-        while len(data) < num_bytes:
-            chunk = self.client_socket.recv(num_bytes - len(data))
-            if not chunk:
-                return None
-            data += chunk
-        return data
-
     def disconnect(self):
         """
         Close the connection to the server.
@@ -157,9 +187,9 @@ class ClassicalClient:
         if self.client_socket:
             try:
                 self.client_socket.close()
-                print("[CLIENT] Disconnected from server")
+                logger.debug("Disconnected from server")
             except Exception as e:
-                print(f"[CLIENT][ERROR] Error closing socket: {e}")
+                logger.error("Error closing socket: %s", e)
         self.client_socket = None
         self.aesgcm = None
 
@@ -168,6 +198,9 @@ def main():
     """
     Main entry point for interactive client execution.
     """
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ConsoleFormatter("CLIENT"))
+    logging.basicConfig(level=logging.DEBUG, handlers=[console_handler])
     client = ClassicalClient()
 
     try:
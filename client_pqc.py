@@ -1,9 +1,24 @@
-import os
+import logging
 import socket
 
 from oqs import oqs
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
+from common import (
+    ConsoleFormatter,
+    KYBER768_CIPHERTEXT_BYTES,
+    MAX_MESSAGE_BYTES,
+    MLDSA65_PUBLIC_KEY_BYTES,
+    MLDSA65_SIGNATURE_BYTES,
+    NONCE_PREFIX,
+    PACK_U32,
+    PACK_U64,
+    receive_frame,
+    send_buffers,
+)
+
+logger = logging.getLogger(__name__)
+
 
 class PQCClient:
     """
@@ -12,23 +27,37 @@ class PQCClient:
     Designed to work with PQCServer for secure message transmission.
     """
 
-    def __init__(self, host="localhost", port=12346):
+    def __init__(self, host="localhost", port=12346, sock=None):
         self.host = host
         self.port = port
-        self.client_socket = None
+        self.client_socket = sock  # Optional pre-connected socket (e.g. socketpair end)
         self.aesgcm = None
         self.connected = False
+        self._send_counter = 0
 
-    def connect(self):
+        # Long-lived liboqs contexts, reused by every handshake on this client
+        self._kem = oqs.KeyEncapsulation("Kyber768")
+        self._sig = oqs.Signature("ML-DSA-65")
+
+    def connect(self, sock=None):
         """
         Connect to the server and perform post-quantum key exchange.
+        If sock is given, the handshake runs over that already-connected socket,
+        so one client (and its liboqs contexts) can serve many connections.
         Returns True on success, False on failure.
         """
         try:
-            # Create socket and connect
-            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.client_socket.connect((self.host, self.port))
-            print(f"[PQC CLIENT] Connected to {self.host}:{self.port}")
+            if sock is not None:
+                self.disconnect()
+                self.client_socket = sock
+
+            # Create socket and connect, unless a connected socket was supplied
+            if self.client_socket is None:
+                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # Don't let Nagle hold back small handshake frames
+                self.client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.client_socket.connect((self.host, self.port))
+                logger.debug("Connected to %s:%s", self.host, self.port)
 
             # Perform post-quantum key exchange
             aes_key = self._perform_pqc_key_exchange()
@@ -38,12 +67,13 @@ class PQCClient:
 
             # Initialize AES-GCM cipher
             self.aesgcm = AESGCM(aes_key)
+            self._send_counter = 0  # Every handshake derives a fresh key
             self.connected = True
-            print("[PQC CLIENT] Secure channel established")
+            logger.debug("Secure channel established")
             return True
 
         except Exception as e:
-            print(f"[PQC CLIENT][ERROR] Connection failed: {e}")
+            logger.error("Connection failed: %s", e)
             self.disconnect()
             return False
 
@@ -53,111 +83,81 @@ class PQCClient:
         Returns the derived AES-256 key or None on failure.
         """
         try:
-            # Initialize Kyber768 KEM and ML-DSA-65 signature
-            with oqs.KeyEncapsulation("Kyber768") as kem:
-                with oqs.Signature("ML-DSA-65") as sig:
-                    # Generate client's signature keypair
-                    client_sig_public_key = sig.generate_keypair()
-
-                    # Receive server's signature public key
-                    server_sig_key_length_bytes = self._receive_exact(4)
-                    if not server_sig_key_length_bytes:
-                        return None
-
-                    server_sig_key_length = int.from_bytes(
-                        server_sig_key_length_bytes, byteorder="big"
-                    )
-                    server_sig_public_key = self._receive_exact(server_sig_key_length)
-                    if not server_sig_public_key:
-                        return None
-
-                    print("[PQC CLIENT] Received server signature public key")
-
-                    # Send client's signature public key
-                    sig_key_length = len(client_sig_public_key)
-                    self.client_socket.sendall(
-                        sig_key_length.to_bytes(4, byteorder="big")
-                    )
-                    self.client_socket.sendall(client_sig_public_key)
-                    print("[PQC CLIENT] Sent signature public key")
-
-                    # Generate client's KEM keypair
-                    client_kem_public_key = kem.generate_keypair()
-
-                    # Sign the KEM public key
-                    kem_signature = sig.sign(client_kem_public_key)
-
-                    # Send KEM public key length
-                    kem_pk_length = len(client_kem_public_key)
-                    self.client_socket.sendall(
-                        kem_pk_length.to_bytes(4, byteorder="big")
-                    )
-
-                    # Send KEM public key
-                    self.client_socket.sendall(client_kem_public_key)
-
-                    # Send signature length
-                    signature_length = len(kem_signature)
-                    self.client_socket.sendall(
-                        signature_length.to_bytes(4, byteorder="big")
-                    )
-
-                    # Send signature
-                    self.client_socket.sendall(kem_signature)
-
-                    print("[PQC CLIENT] Sent KEM public key and signature")
-
-                    # Receive ciphertext length
-                    ciphertext_length_bytes = self._receive_exact(4)
-                    if not ciphertext_length_bytes:
-                        return None
-
-                    ciphertext_length = int.from_bytes(
-                        ciphertext_length_bytes, byteorder="big"
-                    )
-
-                    # Receive ciphertext
-                    ciphertext = self._receive_exact(ciphertext_length)
-                    if not ciphertext:
-                        return None
-
-                    # Receive signature length
-                    signature_length_bytes = self._receive_exact(4)
-                    if not signature_length_bytes:
-                        return None
-
-                    signature_length = int.from_bytes(
-                        signature_length_bytes, byteorder="big"
-                    )
-
-                    # Receive signature
-                    ciphertext_signature = self._receive_exact(signature_length)
-                    if not ciphertext_signature:
-                        return None
-
-                    print("[PQC CLIENT] Received ciphertext and signature")
-
-                    # Verify the signature on the ciphertext
-                    is_valid = sig.verify(
-                        ciphertext, ciphertext_signature, server_sig_public_key
-                    )
-                    if not is_valid:
-                        print("[PQC CLIENT][ERROR] Signature verification failed")
-                        return None
-
-                    print("[PQC CLIENT] Server signature verified")
-
-                    # Decapsulate to get shared secret
-                    shared_secret_client = kem.decap_secret(ciphertext)
-
-                    # Use shared secret as AES key (Kyber768 produces 32-byte shared secret)
-                    aes_key = shared_secret_client[:32]  # Ensure 32 bytes for AES-256
-
-                    print("[PQC CLIENT] Key exchange completed")
-                    return aes_key
+            kem = self._kem
+            sig = self._sig
+
+            # Generate client's signature keypair
+            client_sig_public_key = sig.generate_keypair()
+
+            # Receive server's signature public key
+            server_sig_public_key = receive_frame(
+                self.client_socket, MLDSA65_PUBLIC_KEY_BYTES
+            )
+            if not server_sig_public_key:
+                return None
+
+            logger.debug("Received server signature public key")
+
+            # Send client's signature public key
+            sig_key_length = len(client_sig_public_key)
+            self.client_socket.sendall(PACK_U32(sig_key_length) + client_sig_public_key)
+            logger.debug("Sent signature public key")
+
+            # Generate client's KEM keypair
+            client_kem_public_key = kem.generate_keypair()
+
+            # Sign the KEM public key
+            kem_signature = sig.sign(client_kem_public_key)
+
+            # Send KEM public key and its signature in one write:
+            # kem_pk_length | kem_pk | signature_length | signature
+            send_buffers(
+                self.client_socket,
+                (
+                    PACK_U32(len(client_kem_public_key)),
+                    client_kem_public_key,
+                    PACK_U32(len(kem_signature)),
+                    kem_signature,
+                ),
+            )
+
+            logger.debug("Sent KEM public key and signature")
+
+            # Receive ciphertext
+            ciphertext = receive_frame(self.client_socket, KYBER768_CIPHERTEXT_BYTES)
+            if not ciphertext:
+                return None
+
+            # Receive signature
+            ciphertext_signature = receive_frame(
+                self.client_socket, MLDSA65_SIGNATURE_BYTES
+            )
+            if not ciphertext_signature:
+                return None
+
+            logger.debug("Received ciphertext and signature")
+
+            # Verify the signature on the ciphertext
+            is_valid = sig.verify(
+                ciphertext, ciphertext_signature, server_sig_public_key
+            )
+            if not is_valid:
+                logger.error("Signature verification failed")
+                return None
+
+            logger.debug("Server signature verified")
+
+            # Decapsulate to get shared secret
+            shared_secret_client = kem.decap_secret(ciphertext)
+
+            # Use shared secret as AES key (Kyber768 produces 32-byte shared secret)
+            aes_key = shared_secret_client[:32]  # Ensure 32 bytes for AES-256
+
+            logger.debug("Key exchange completed")
+            return aes_key
 
         except Exception as e:
-            print(f"[PQC CLIENT][ERROR] Key exchange failed: {e}")
+            logger.error("Key exchange failed: %s", e)
             return None
 
     def send_message(self, message):
@@ -166,46 +166,38 @@ class PQCClient:
         Returns True on success, False on failure.
         """
         if not self.connected or not self.aesgcm:
-            print("[PQC CLIENT][ERROR] Not connected to server")
+            logger.error("Not connected to server")
             return False
 
         try:
-            # Generate random nonce (96 bits for GCM)
-            nonce = os.urandom(12)
+            plaintext = message.encode("utf-8")
+            if len(plaintext) > MAX_MESSAGE_BYTES:
+                logger.error(
+                    "Message of %s bytes exceeds the %s-byte limit",
+                    len(plaintext),
+                    MAX_MESSAGE_BYTES,
+                )
+                return False
+
+            # Counter nonce (96 bits for GCM): unique under this connection's key,
+            # and the server checks it to reject replayed or reordered messages
+            nonce = NONCE_PREFIX + PACK_U64(self._send_counter)
+            self._send_counter += 1
 
             # Encrypt message
-            plaintext = message.encode("utf-8")
             ciphertext = self.aesgcm.encrypt(nonce, plaintext, None)
 
-            # Send message using protocol: nonce_length | nonce | ciphertext_length | ciphertext
-            nonce_length = len(nonce)
-            self.client_socket.sendall(nonce_length.to_bytes(4, byteorder="big"))
-            self.client_socket.sendall(nonce)
-
-            ciphertext_length = len(ciphertext)
-            self.client_socket.sendall(ciphertext_length.to_bytes(4, byteorder="big"))
-            self.client_socket.sendall(ciphertext)
+            # Send message using protocol: ciphertext_length | nonce | ciphertext
+            # (one buffer, so the whole frame goes out in a single syscall)
+            self.client_socket.sendall(PACK_U32(len(ciphertext)) + nonce + ciphertext)
 
-            print(f"[PQC CLIENT] Sent encrypted message: {message}")
+            logger.debug("Sent encrypted message: %s", message)
             return True
 
         except Exception as e:
-            print(f"[PQC CLIENT][ERROR] Failed to send message: {e}")
+            logger.error("Failed to send message: %s", e)
             return False
 
-    def _receive_exact(self, num_bytes):
-        """
-        Receive exactly num_bytes from the socket.
-        Returns the data or None if connection closed.
-        """
-        data = b""
-        while len(data) < num_bytes:
-            chunk = self.client_socket.recv(num_bytes - len(data))
-            if not chunk:
-                return None
-            data += chunk
-        return data
-
     def disconnect(self):
         """
         Close the connection to the server.
@@ -214,17 +206,32 @@ class PQCClient:
         if self.client_socket:
             try:
                 self.client_socket.close()
-                print("[PQC CLIENT] Disconnected from server")
+                logger.debug("Disconnected from server")
             except Exception as e:
-                print(f"[PQC CLIENT][ERROR] Error closing socket: {e}")
+                logger.error("Error closing socket: %s", e)
         self.client_socket = None
         self.aesgcm = None
 
+    def close(self):
+        """
+        Disconnect and release the liboqs contexts.
+        The client cannot connect again afterwards.
+        """
+        self.disconnect()
+        if self._kem:
+            self._kem.free()
+            self._sig.free()
+            self._kem = None
+            self._sig = None
+
 
 def main():
     """
     Main entry point for interactive client execution.
     """
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(ConsoleFormatter("PQC CLIENT"))
+    logging.basicConfig(level=logging.DEBUG, handlers=[console_handler])
     client = PQCClient()
 
     try:
@@ -249,7 +256,7 @@ def main():
     except KeyboardInterrupt:
         print("\n[PQC CLIENT] Interrupted by user")
     finally:
-        client.disconnect()
+        client.close()
 
 
 if __name__ == "__main__":
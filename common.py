@@ -0,0 +1,105 @@
+"""
+Wire format constants, socket helpers and console logging shared by the
+classical and PQC clients and servers.
+"""
+
+import logging
+import socket
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Big-endian 4-byte length prefixes and 8-byte counters, with the formats
+# compiled once
+PACK_U32 = struct.Struct(">I").pack
+UNPACK_U32 = struct.Struct(">I").unpack
+PACK_U64 = struct.Struct(">Q").pack
+
+# AES-GCM nonces are 4 zero bytes followed by a per-connection message counter
+NONCE_PREFIX = bytes(4)
+NONCE_BYTES = 12
+GCM_TAG_BYTES = 16
+
+# Largest frame accepted for each handshake field and message. Lengths come from
+# the peer before any authentication, so they are checked before allocating.
+X25519_PUBLIC_KEY_BYTES = 32  # Raw encoding
+KYBER768_PUBLIC_KEY_BYTES = 1184
+KYBER768_CIPHERTEXT_BYTES = 1088
+MLDSA65_PUBLIC_KEY_BYTES = 1952
+MLDSA65_SIGNATURE_BYTES = 3309
+MAX_MESSAGE_BYTES = 64 * 1024  # Plaintext of one encrypted message
+
+# Have the kernel wait for a full frame before returning, where supported
+RECV_FLAGS = getattr(socket, "MSG_WAITALL", 0)
+
+
+def send_buffers(sock, buffers):
+    """
+    Send buffers back to back with scatter-gather sendmsg(), without joining them first.
+    Falls back to one joined sendall() where sendmsg() is unavailable (e.g. Windows).
+    """
+    if not hasattr(sock, "sendmsg"):
+        sock.sendall(b"".join(buffers))
+        return
+
+    views = [memoryview(buffer) for buffer in buffers]
+    while views:
+        sent = sock.sendmsg(views)
+        # Drop fully sent buffers and trim a partially sent one
+        while views and sent >= len(views[0]):
+            sent -= len(views[0])
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def receive_exact(sock, num_bytes):
+    """
+    Receive exactly num_bytes from sock.
+    Returns the data or None if the connection closed first.
+    """
+    # Read straight into one preallocated buffer instead of growing a bytes object.
+    # With MSG_WAITALL this normally takes one call; the loop covers short
+    # reads (signals, timeouts, platforms without the flag).
+    buffer = bytearray(num_bytes)
+    view = memoryview(buffer)
+    received = 0
+    while received < num_bytes:
+        count = sock.recv_into(view[received:], num_bytes - received, RECV_FLAGS)
+        if not count:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+def receive_frame(sock, max_bytes):
+    """
+    Receive one length-prefixed frame: a 4-byte big-endian length, then the data.
+    Returns the data, or None if the connection closed or the peer announced
+    more than max_bytes, in which case the caller should drop the connection.
+    """
+    header = receive_exact(sock, 4)
+    if not header:
+        return None
+    length = UNPACK_U32(header)[0]
+    if length > max_bytes:
+        logger.error("Rejected a %s-byte frame (limit %s bytes)", length, max_bytes)
+        return None
+    return receive_exact(sock, length)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    Format records as "[TAG] message", or "[TAG][ERROR] message" (with the level
+    name) for warnings and above.
+    """
+
+    def __init__(self, tag):
+        super().__init__("%(message)s")
+        self._tag = tag
+
+    def format(self, record):
+        message = super().format(record)
+        if record.levelno >= logging.WARNING:
+            return f"[{self._tag}][{record.levelname}] {message}"
+        return f"[{self._tag}] {message}"
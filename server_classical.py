@@ -1,15 +1,35 @@
+import logging
+import logging.handlers
+import queue
+import selectors
 import socket
 import threading
 
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import x25519
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 
+from common import (
+    ConsoleFormatter,
+    GCM_TAG_BYTES,
+    MAX_MESSAGE_BYTES,
+    NONCE_BYTES,
+    NONCE_PREFIX,
+    PACK_U32,
+    PACK_U64,
+    UNPACK_U32,
+    X25519_PUBLIC_KEY_BYTES,
+    receive_exact,
+    receive_frame,
+)
+
+logger = logging.getLogger(__name__)
+
 
 class ClassicalServer:
     """
-    A secure TCP server implementing ECDH key exchange and AES-GCM encryption.
+    A secure TCP server implementing X25519 ECDH key exchange and AES-GCM encryption.
     Designed for testability with thread-safe operation and message tracking.
     """
 
@@ -22,37 +42,121 @@ class ClassicalServer:
         self._lock = threading.Lock()
         self.message_received_event = message_received_event
 
+        # Open client sockets and the threads serving them, so stop() can
+        # close the connections and wait for their handlers
+        self._connections = {}
+
+        # Self-pipe created by listen(): stop() writes to _wake_w to wake the
+        # accept loop. The event is clear while the accept loop runs, and a
+        # stop() stays pending, so a later start() returns, until listen()
+        self._wake_r = None
+        self._wake_w = None
+        self._accept_loop_done = threading.Event()
+        self._accept_loop_done.set()
+        self._stop_requested = False
+
+    def listen(self):
+        """
+        Create, bind and listen on the server socket without accepting yet.
+        Once this returns, clients can connect (they queue in the backlog), so
+        callers may run start() on another thread without waiting for it.
+        A port of 0 binds an ephemeral port, stored back into self.port.
+        Also re-arms a stopped server, so start() can run again.
+        """
+        with self._lock:
+            self._stop_requested = False
+            self._bind()
+
+    def _bind(self):
+        """
+        Open the listening socket and self-pipe. Call with self._lock held.
+        """
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server_socket.bind((self.host, self.port))
+            server_socket.listen(socket.SOMAXCONN)
+            # Non-blocking, so accept() returns at once if a client that woke
+            # the selector has already gone away
+            server_socket.setblocking(False)
+        except OSError:
+            server_socket.close()
+            raise
+        self.server_socket = server_socket
+        self.port = server_socket.getsockname()[1]
+        self._wake_r, self._wake_w = socket.socketpair()
+        logger.info("Listening on %s:%s", self.host, self.port)
+
     def start(self):
         """
-        Start the server and begin listening for connections.
-        Runs in the calling thread.
+        Start the server and begin accepting connections, binding the listening
+        socket first unless listen() has already done so.
+        Runs in the calling thread. Returns at once if stop() has been called;
+        to restart a stopped server, call listen() and then start().
         """
-        self.running = True
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(1)
-            self.server_socket.settimeout(
-                1.0
-            )  # Allow periodic checking of running flag
-            print(f"[SERVER] Listening on {self.host}:{self.port}")
-
-            while self.running:
-                try:
-                    client_socket, address = self.server_socket.accept()
-                    print(f"[SERVER] Connection from {address}")
-                    self._handle_client(client_socket)
-                except socket.timeout:
-                    continue  # Check running flag and continue listening
-                except Exception as e:
-                    if self.running:
-                        print(f"[SERVER][ERROR] Accept error: {e}")
+            with self._lock:
+                if self._stop_requested:
+                    return
+                if self.server_socket is None:
+                    self._bind()
+                self.running = True
+                self._accept_loop_done.clear()
+
+            # Sleep until a client connects or stop() writes to the self-pipe
+            with selectors.DefaultSelector() as selector:
+                selector.register(self.server_socket, selectors.EVENT_READ)
+                selector.register(self._wake_r, selectors.EVENT_READ)
+                while self.running:
+                    for key, _ in selector.select():
+                        if key.fileobj is self._wake_r:
+                            return
+                        try:
+                            self._accept()
+                        except BlockingIOError:
+                            pass  # The client disconnected before accept()
+                        except Exception as e:
+                            if self.running:
+                                logger.error("Accept error: %s", e)
 
         except Exception as e:
-            print(f"[SERVER][ERROR] Server initialization failed: {e}")
+            logger.error("Server initialization failed: %s", e)
         finally:
             self._cleanup()
+            self._accept_loop_done.set()
+
+    def _accept(self):
+        """
+        Accept one pending connection on the listening socket and hand it to
+        serve_connection().
+        """
+        client_socket, address = self.server_socket.accept()
+        logger.debug("Connection from %s", address)
+        # Some platforms (e.g. BSD, macOS) pass on the listener's O_NONBLOCK
+        client_socket.setblocking(True)
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.serve_connection(client_socket)
+
+    def activate(self):
+        """
+        Mark the server running without listening, for callers that only hand
+        it sockets through serve_connection(). stop() ends it as usual.
+        """
+        self.running = True
+
+    def serve_connection(self, client_socket):
+        """
+        Serve an already-connected socket on its own thread.
+        Used by the accept loop, and directly for socketpair loopback connections.
+        """
+        # Serve each client on its own thread so concurrent handshakes are not
+        # serialized behind one another, and idle connections cannot starve others
+        thread = threading.Thread(
+            target=self._handle_client, args=(client_socket,), daemon=True
+        )
+        with self._lock:
+            self._connections[client_socket] = thread
+        thread.start()
 
     def _handle_client(self, client_socket):
         """
@@ -65,17 +169,22 @@ class ClassicalServer:
                 if not aes_key:
                     return
 
+                # One cipher for the whole connection
                 aesgcm = AESGCM(aes_key)
-                print("[SERVER] Secure channel established")
+                sequence = 0  # Counter expected in the next message's nonce
+                logger.debug("Secure channel established")
 
                 # Message reception loop
                 while self.running:
                     try:
-                        message = self._receive_encrypted_message(client_socket, aesgcm)
+                        message = self._receive_encrypted_message(
+                            client_socket, aesgcm, sequence
+                        )
                         if message is None:
                             break
+                        sequence += 1
 
-                        print(f"[SERVER] Decrypted message: {message}")
+                        logger.debug("Decrypted message: %s", message)
 
                         # Store last received message (thread-safe)
                         with self._lock:
@@ -86,15 +195,18 @@ class ClassicalServer:
                             self.message_received_event.set()
 
                         if message.lower() == "exit":
-                            print("[SERVER] Client requested disconnect")
+                            logger.debug("Client requested disconnect")
                             break
 
                     except Exception as e:
-                        print(f"[SERVER][ERROR] Message reception error: {e}")
+                        logger.error("Message reception error: %s", e)
                         break
 
         except Exception as e:
-            print(f"[SERVER][ERROR] Client handler error: {e}")
+            logger.error("Client handler error: %s", e)
+        finally:
+            with self._lock:
+                self._connections.pop(client_socket, None)
 
     def _perform_key_exchange(self, client_socket):
         """
@@ -102,39 +214,35 @@ class ClassicalServer:
         Returns the derived AES-256 key or None on failure.
         """
         try:
-            # Generate server's ECDH key pair
-            server_private_key = ec.generate_private_key(ec.SECP384R1())
+            # Generate server's X25519 key pair
+            server_private_key = x25519.X25519PrivateKey.generate()
             server_public_key = server_private_key.public_key()
 
-            # Serialize server's public key
+            # Serialize server's public key (raw 32-byte encoding)
             server_public_bytes = server_public_key.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+                encoding=serialization.Encoding.Raw,
+                format=serialization.PublicFormat.Raw,
             )
 
             # Send server's public key (length + data)
             key_length = len(server_public_bytes)
-            client_socket.sendall(key_length.to_bytes(4, byteorder="big"))
-            client_socket.sendall(server_public_bytes)
-            print("[SERVER] Sent public key")
+            client_socket.sendall(PACK_U32(key_length) + server_public_bytes)
+            logger.debug("Sent public key")
 
             # Receive client's public key
-            client_key_length_bytes = self._receive_exact(client_socket, 4)
-            if not client_key_length_bytes:
-                return None
-
-            client_key_length = int.from_bytes(client_key_length_bytes, byteorder="big")
-            client_public_bytes = self._receive_exact(client_socket, client_key_length)
+            client_public_bytes = receive_frame(client_socket, X25519_PUBLIC_KEY_BYTES)
             if not client_public_bytes:
                 return None
 
-            print("[SERVER] Received client public key")
+            logger.debug("Received client public key")
 
             # Deserialize client's public key
-            client_public_key = serialization.load_pem_public_key(client_public_bytes)
+            client_public_key = x25519.X25519PublicKey.from_public_bytes(
+                client_public_bytes
+            )
 
             # Compute shared secret
-            shared_secret = server_private_key.exchange(ec.ECDH(), client_public_key)
+            shared_secret = server_private_key.exchange(client_public_key)
 
             # Derive AES key using HKDF
             derived_key = HKDF(
@@ -144,49 +252,50 @@ class ClassicalServer:
                 info=b"handshake data",
             ).derive(shared_secret)
 
-            print("[SERVER] Key exchange completed")
+            logger.debug("Key exchange completed")
             return derived_key
 
         except Exception as e:
-            print(f"[SERVER][ERROR] Key exchange failed: {e}")
+            logger.error("Key exchange failed: %s", e)
             return None
 
-    def _receive_encrypted_message(self, client_socket, aesgcm):
+    def _receive_encrypted_message(self, client_socket, aesgcm, sequence):
         """
-        Receive and decrypt a message using the protocol: nonce_length | nonce | ciphertext_length | ciphertext.
+        Receive and decrypt a message using the protocol: ciphertext_length | nonce | ciphertext.
+        The 12-byte nonce must carry sequence, the message's position on the connection;
+        replayed, reordered or skipped messages are rejected.
         Returns the decrypted message string or None on failure/disconnect.
         """
         try:
-            # Receive nonce length (4 bytes)
-            nonce_length_bytes = self._receive_exact(client_socket, 4)
-            if not nonce_length_bytes:
+            # Receive ciphertext length (4 bytes)
+            header = self._receive_exact(client_socket, 4)
+            if not header:
                 return None
 
-            nonce_length = int.from_bytes(nonce_length_bytes, byteorder="big")
-
-            # Receive nonce
-            nonce = self._receive_exact(client_socket, nonce_length)
-            if not nonce:
+            ciphertext_length = UNPACK_U32(header)[0]
+            if ciphertext_length > MAX_MESSAGE_BYTES + GCM_TAG_BYTES:
+                logger.error("Rejected a %s-byte message", ciphertext_length)
                 return None
 
-            # Receive ciphertext length (4 bytes)
-            ciphertext_length_bytes = self._receive_exact(client_socket, 4)
-            if not ciphertext_length_bytes:
+            # Receive nonce and ciphertext together
+            body = self._receive_exact(client_socket, NONCE_BYTES + ciphertext_length)
+            if not body:
                 return None
 
-            ciphertext_length = int.from_bytes(ciphertext_length_bytes, byteorder="big")
-
-            # Receive ciphertext
-            ciphertext = self._receive_exact(client_socket, ciphertext_length)
-            if not ciphertext:
+            # Decrypt message, slicing the body without copying it. The whole
+            # message goes to OpenSSL in one call: its AES-GCM code already
+            # interleaves blocks internally, and splitting the work into small
+            # update_into() tiles would only add per-call Python overhead.
+            body = memoryview(body)
+            nonce, ciphertext = body[:NONCE_BYTES], body[NONCE_BYTES:]
+            if nonce != NONCE_PREFIX + PACK_U64(sequence):
+                logger.error("Unexpected nonce for message %s", sequence)
                 return None
 
-            # Decrypt message
-            plaintext = aesgcm.decrypt(nonce, ciphertext, None)
-            return plaintext.decode("utf-8")
+            return aesgcm.decrypt(nonce, ciphertext, None).decode("utf-8")
 
         except Exception as e:
-            print(f"[SERVER][ERROR] Decryption error: {e}")
+            logger.error("Decryption error: %s", e)
             return None
 
     def _receive_exact(self, sock, num_bytes):
@@ -194,42 +303,73 @@ class ClassicalServer:
         Receive exactly num_bytes from the socket.
         Returns the data or None if connection closed.
         """
-        data = b""
-        while len(data) < num_bytes:
-            chunk = sock.recv(num_bytes - len(data))
-            if not chunk:
-                return None
-            data += chunk
-        return data
+        return receive_exact(sock, num_bytes)
 
     def stop(self):
         """
         Gracefully stop the server.
         """
-        print("[SERVER] Stopping server...")
-        self.running = False
-        if self.server_socket:
+        logger.info("Stopping server...")
+        with self._lock:
+            self._stop_requested = True
+            self.running = False
+            wake_w = self._wake_w
+        if wake_w is not None:
             try:
-                self.server_socket.close()
-            except Exception as e:
-                print(f"[SERVER][ERROR] Error closing server socket: {e}")
+                wake_w.send(b"\0")
+            except OSError:
+                pass  # Accept loop already finished
+
+        # A running accept loop closes the listening socket and self-pipe on
+        # its way out; close them here if start() never ran
+        self._accept_loop_done.wait(timeout=2.0)
+        self._cleanup()
+
+        # Unblock handlers waiting on idle clients, then wait for them to
+        # close their sockets and finish
+        with self._lock:
+            connections = list(self._connections.items())
+        for client_socket, _ in connections:
+            try:
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # Already closed by its handler
+        for _, thread in connections:
+            thread.join(timeout=2.0)
+        logger.info("Server stopped")
 
     def _cleanup(self):
         """
-        Clean up server resources.
+        Close the listening socket and self-pipe, if open.
+        Safe to call more than once; a later listen() opens them again.
         """
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except Exception:
-                pass
-        print("[SERVER] Server stopped")
+        with self._lock:
+            sockets = (self.server_socket, self._wake_r, self._wake_w)
+            self.server_socket = None
+            self._wake_r = None
+            self._wake_w = None
+        for sock in sockets:
+            if sock is not None:
+                try:
+                    sock.close()
+                except OSError as e:
+                    logger.error("Error closing server socket: %s", e)
 
 
 def main():
     """
     Main entry point for standalone server execution.
     """
+    # Handler threads only enqueue log records; a listener thread writes them
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(ConsoleFormatter("SERVER"))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.basicConfig(level=logging.DEBUG, handlers=[queue_handler])
+    listener.start()
+
     server = ClassicalServer()
     try:
         server.start()
@@ -237,6 +377,7 @@ def main():
         print("\n[SERVER] Interrupted by user")
     finally:
         server.stop()
+        listener.stop()
 
 
 if __name__ == "__main__":
@@ -66,8 +66,11 @@ async function startBenchmark() {
     const latency = parseFloat(elements.latencySlider.value);
     const packetLoss = parseFloat(elements.packetLossSlider.value);
     
+    // Hybrid results are derived from the classical and PQC runs, so only those report progress
+    const measuredModes = new Set(modes.flatMap(m => m === 'hybrid' ? ['classical', 'pqc'] : [m]));
+    
     currentBenchmark = {
-        totalIterations: modes.length * 50,
+        totalIterations: measuredModes.size * 50,
         completedIterations: 0,
         modes: modes,
     };
@@ -126,6 +129,9 @@ function handleWebSocketMessage(message) {
         case 'progress':
             handleProgress(message);
             break;
+        case 'status':
+            handleStatus(message.message);
+            break;
         case 'result':
             handleResults(message.data);
             break;
@@ -148,6 +154,11 @@ function handleProgress(message) {
     log(`▶️ ${mode} - ${iteration}/${total}`);
 }
 
+function handleStatus(message) {
+    elements.progressText.textContent = message;
+    log(`⏳ ${message}`);
+}
+
 function updateProgress(percent) {
     percent = Math.min(Math.max(percent, 0), 100);
     elements.progressBar.style.width = `${percent}%`;
@@ -0,0 +1,166 @@
+import unittest
+
+import numpy as np
+
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """
+    Tests for how benchmark results are derived from the measured handshakes.
+    """
+
+    def test_latency_added_without_loss(self):
+        """
+        Test that without packet loss the latency is added to every sample exactly,
+        and that a negative latency is treated as none.
+        """
+        samples = np.array([1.0, 2.5, 4.0])
+        rng = np.random.default_rng(0)
+
+        np.testing.assert_array_equal(
+            benchmark._apply_penalties_vec(samples, 10.0, 0.0, rng), [11.0, 12.5, 14.0]
+        )
+        np.testing.assert_array_equal(
+            benchmark._apply_penalties_vec(samples, -5.0, 0.0, rng), samples
+        )
+
+    def test_packet_loss_penalty_bounds(self):
+        """
+        Test that packet loss scales each latency-adjusted sample by the loss rate,
+        adds jitter of up to loss_percent / 500 of the scaled sample, and leaves
+        the input array untouched.
+        """
+        samples = np.linspace(1.0, 100.0, 1000)
+        latency_ms, loss_percent = 20.0, 5.0
+        scaled = (samples + latency_ms) * (1.0 + loss_percent / 100.0)
+
+        adjusted = benchmark._apply_penalties_vec(
+            samples, latency_ms, loss_percent, np.random.default_rng(0)
+        )
+
+        self.assertEqual(adjusted.shape, samples.shape)
+        self.assertTrue(np.all(adjusted >= scaled))
+        self.assertTrue(np.all(adjusted <= scaled * (1.0 + loss_percent / 500.0)))
+        np.testing.assert_array_equal(samples, np.linspace(1.0, 100.0, 1000))
+
+    def test_parallel_hybrid_takes_slower_exchange(self):
+        """
+        Test that a parallel hybrid sample is the slower of the classical and
+        PQC handshakes with the same index.
+        """
+        classical = np.array([1.0, 5.0, 2.0])
+        pqc = np.array([3.0, 4.0, 2.5])
+
+        hybrid = benchmark._combine_hybrid(classical, pqc, "parallel")
+
+        np.testing.assert_array_equal(hybrid, [3.0, 5.0, 2.5])
+
+    def test_sequential_hybrid_adds_exchanges(self):
+        """
+        Test that a sequential hybrid sample is the sum of the classical and
+        PQC handshakes with the same index.
+        """
+        classical = np.array([1.0, 5.0, 2.0])
+        pqc = np.array([3.0, 4.0, 2.5])
+
+        hybrid = benchmark._combine_hybrid(classical, pqc, "sequential")
+
+        np.testing.assert_array_equal(hybrid, [4.0, 9.0, 4.5])
+
+    def test_invalid_hybrid_mode_rejected(self):
+        """
+        Test that an unknown hybrid_mode is rejected before any benchmark runs.
+        """
+        with self.assertRaises(ValueError):
+            benchmark.run_all_benchmarks(hybrid_mode="interleaved")
+
+    def test_invalid_handshake_threads_rejected(self):
+        """
+        Test that a handshake_threads count below 1 is rejected before any
+        benchmark runs.
+        """
+        with self.assertRaises(ValueError):
+            benchmark.run_all_benchmarks(handshake_threads=0)
+
+    def test_handshake_threads_reported(self):
+        """
+        Test that handshakes run one at a time by default, that more threads
+        are opt-in, and that the count used is reported in the settings.
+        """
+        for handshake_threads in (None, 2):
+            with self.subTest(handshake_threads=handshake_threads):
+                kwargs = (
+                    {"handshake_threads": handshake_threads}
+                    if handshake_threads
+                    else {}
+                )
+
+                results = benchmark.run_all_benchmarks(["classical"], **kwargs)
+
+                self.assertEqual(
+                    results["settings"]["handshake_threads"], handshake_threads or 1
+                )
+                self.assertEqual(
+                    len(results["handshake_samples"]["classical"]),
+                    benchmark.ITERATIONS_PER_MODE,
+                )
+
+    def test_pinned_modes_run_one_handshake_at_a_time(self):
+        """
+        Test that concurrent handshakes are rejected when cpu_ids pins each mode,
+        with its client and server, to a single CPU.
+        """
+        with self.assertRaises(ValueError):
+            benchmark.run_all_benchmarks(cpu_ids=[0], handshake_threads=2)
+
+    def test_progress_relayed_from_mode_workers(self):
+        """
+        Test that every progress update sent by the mode worker processes is
+        drained and passed to progress_callback, in completion order per mode.
+        """
+        updates = []
+
+        benchmark.run_all_benchmarks(
+            ["classical", "pqc"], progress_callback=lambda *u: updates.append(u)
+        )
+
+        for label in ("Classical", "PQC"):
+            with self.subTest(label=label):
+                total = benchmark.ITERATIONS_PER_MODE
+                self.assertEqual(
+                    [u for u in updates if u[0] == label],
+                    [(label, completed, total) for completed in range(1, total + 1)],
+                )
+
+    def test_transport_reported(self):
+        """
+        Test that runs without network simulation use a socketpair, runs with it
+        use TCP, and that the transport is reported in the settings.
+        """
+        for latency_ms, transport in ((0.0, "socketpair"), (1.0, "tcp")):
+            with self.subTest(latency_ms=latency_ms):
+                results = benchmark.run_all_benchmarks(
+                    ["classical"], latency_ms=latency_ms
+                )
+
+                self.assertEqual(results["settings"]["transport"], transport)
+
+    def test_key_size_constants_match_generated_keys(self):
+        """
+        Test that the hard-coded key and signature sizes match freshly
+        generated X25519, Kyber768 and ML-DSA-65 keys.
+        """
+        benchmark._verify_key_sizes.cache_clear()
+        benchmark._verify_key_sizes()  # Raises RuntimeError on a mismatch
+
+
+def run_tests():
+    """
+    Run the test suite with verbose output.
+    """
+    unittest.main(verbosity=2)
+
+
+if __name__ == "__main__":
+    run_tests()
@@ -1,8 +1,11 @@
+import socket
+import struct
 import threading
 import time
 import unittest
 
 from client_classical import ClassicalClient
+from common import MAX_MESSAGE_BYTES
 from server_classical import ClassicalServer
 
 
@@ -86,7 +89,7 @@ class TestSecureChannel(unittest.TestCase):
     def test_multiple_messages(self):
         """
         Test sending multiple messages in sequence to verify the encryption
-        nonce randomization and message integrity across multiple transmissions.
+        nonce sequencing and message integrity across multiple transmissions.
         """
         server = None
         server_thread = None
@@ -153,6 +156,207 @@ class TestSecureChannel(unittest.TestCase):
         )
         self.assertFalse(client.connected, "Client should not be marked as connected")
 
+    def _loopback(self, message_event):
+        """
+        Create an activated server and a client joined to it by a socketpair,
+        with no listening socket involved.
+        """
+        server = ClassicalServer(message_received_event=message_event)
+        server.activate()
+        server_end, client_end = socket.socketpair()
+        server.serve_connection(server_end)
+        return server, ClassicalClient(sock=client_end)
+
+    def test_socketpair_connection(self):
+        """
+        Test serving a socketpair connection through serve_connection(): the
+        handshake completes and each message round-trips under the next
+        counter nonce.
+        """
+        message_event = threading.Event()
+        server, client = self._loopback(message_event)
+
+        try:
+            self.assertTrue(client.connect(), "Client should connect over a socketpair")
+
+            for count, msg in enumerate(["one", "two", "three"], start=1):
+                message_event.clear()
+                self.assertTrue(client.send_message(msg), f"Should send: {msg}")
+                self.assertTrue(
+                    message_event.wait(timeout=2),
+                    f"Server should receive message within timeout: {msg}",
+                )
+                self.assertEqual(server.last_received_message, msg)
+                self.assertEqual(
+                    client._send_counter,
+                    count,
+                    "Each message should use the next counter nonce",
+                )
+
+        finally:
+            client.disconnect()
+            server.stop()
+
+    def test_replayed_or_reordered_nonce_rejected(self):
+        """
+        Test that the server drops the connection when a message repeats an
+        earlier counter nonce (replay) or skips ahead of the next one (reorder).
+        """
+        for counter in (0, 5):
+            with self.subTest(counter=counter):
+                message_event = threading.Event()
+                server, client = self._loopback(message_event)
+
+                try:
+                    self.assertTrue(client.connect(), "Client should connect")
+                    self.assertTrue(client.send_message("first"))
+                    self.assertTrue(message_event.wait(timeout=2))
+                    message_event.clear()
+
+                    # A valid frame under the session key, but with the wrong counter
+                    nonce = bytes(4) + struct.pack(">Q", counter)
+                    ciphertext = client.aesgcm.encrypt(nonce, b"forged", None)
+                    client.client_socket.sendall(
+                        struct.pack(">I", len(ciphertext)) + nonce + ciphertext
+                    )
+
+                    # The server closes the connection instead of accepting it
+                    client.client_socket.settimeout(2)
+                    self.assertEqual(client.client_socket.recv(1), b"")
+                    self.assertFalse(message_event.is_set())
+                    self.assertEqual(server.last_received_message, "first")
+
+                finally:
+                    client.disconnect()
+                    server.stop()
+
+    def test_listen_on_ephemeral_port(self):
+        """
+        Test that listen() with port 0 binds a free port and stores it in
+        server.port for clients to connect to.
+        """
+        server = ClassicalServer(host="127.0.0.1", port=0)
+        server_thread = None
+        client = None
+
+        try:
+            server.listen()
+            self.assertNotEqual(server.port, 0, "Server should record the bound port")
+
+            server_thread = threading.Thread(target=server.start, daemon=True)
+            server_thread.start()
+
+            client = ClassicalClient(host="127.0.0.1", port=server.port)
+            self.assertTrue(client.connect(), "Client should connect to the bound port")
+
+        finally:
+            if client:
+                client.disconnect()
+            server.stop()
+            if server_thread:
+                server_thread.join(timeout=2.0)
+
+    def test_stop_wakes_accept_loop(self):
+        """
+        Test that stop() wakes a running accept loop through the self-pipe at once,
+        closes the listening socket, and that listen() re-arms the server.
+        """
+        server = ClassicalServer(host="127.0.0.1", port=0)
+        server.listen()
+        port = server.port
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        while not server.running and server_thread.is_alive():
+            time.sleep(0.001)
+
+        started = time.monotonic()
+        server.stop()
+        server_thread.join(timeout=2.0)
+        self.assertFalse(server_thread.is_alive(), "Accept loop should exit")
+        self.assertLess(
+            time.monotonic() - started, 0.5, "stop() should not wait for a poll timeout"
+        )
+        self.assertIsNone(server.server_socket, "Listening socket should be closed")
+
+        # Restart on the same port
+        client = None
+        try:
+            server.listen()
+            self.assertEqual(server.port, port)
+            server_thread = threading.Thread(target=server.start, daemon=True)
+            server_thread.start()
+
+            client = ClassicalClient(host="127.0.0.1", port=port)
+            self.assertTrue(client.connect(), "Restarted server should accept clients")
+
+        finally:
+            if client:
+                client.disconnect()
+            server.stop()
+            server_thread.join(timeout=2.0)
+
+    def test_stop_before_start(self):
+        """
+        Test that a stop() issued before the accept thread reaches start() is not
+        lost: start() returns at once instead of binding and serving again.
+        """
+        server = ClassicalServer(host="127.0.0.1", port=0)
+        server.listen()
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server.stop()
+        server_thread.start()
+        server_thread.join(timeout=2.0)
+
+        self.assertFalse(server_thread.is_alive(), "start() should return at once")
+        self.assertFalse(server.running, "Server should stay stopped")
+        self.assertIsNone(server.server_socket, "start() should not bind again")
+
+    def test_oversized_handshake_frame_rejected(self):
+        """
+        Test that the server drops a connection announcing a handshake frame
+        longer than the key it expects, before reading or allocating it.
+        """
+        server = ClassicalServer()
+        server.activate()
+        server_end, client_end = socket.socketpair()
+        server.serve_connection(server_end)
+
+        try:
+            client_end.sendall(struct.pack(">I", 0xF0000000))
+
+            # Anything the server sent first is drained, then the connection closes
+            client_end.settimeout(2)
+            while client_end.recv(65536):
+                pass
+
+        finally:
+            client_end.close()
+            server.stop()
+
+    def test_oversized_message_rejected(self):
+        """
+        Test that the client refuses to send a message over MAX_MESSAGE_BYTES
+        and that the server drops a connection announcing one.
+        """
+        message_event = threading.Event()
+        server, client = self._loopback(message_event)
+
+        try:
+            self.assertTrue(client.connect(), "Client should connect")
+            self.assertFalse(
+                client.send_message("x" * (MAX_MESSAGE_BYTES + 1)),
+                "Client should refuse a message over the limit",
+            )
+
+            client.client_socket.sendall(struct.pack(">I", 0xF0000000))
+            client.client_socket.settimeout(2)
+            self.assertEqual(client.client_socket.recv(1), b"")
+            self.assertFalse(message_event.is_set())
+
+        finally:
+            client.disconnect()
+            server.stop()
+
 
 def run_tests():
     """
@@ -0,0 +1,127 @@
+import socket
+import unittest
+
+from common import receive_frame, send_buffers
+
+
+class _ChunkedSocket:
+    """
+    Stand-in socket whose sendmsg() accepts at most chunk_size bytes per call,
+    like a kernel send buffer that is nearly full.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.sent = bytearray()
+        self.calls = 0
+
+    def sendmsg(self, buffers):
+        self.calls += 1
+        data = b"".join(bytes(buffer) for buffer in buffers)[: self.chunk_size]
+        self.sent += data
+        return len(data)
+
+
+class _SendallOnlySocket:
+    """
+    Stand-in socket without sendmsg(), as on Windows.
+    """
+
+    def __init__(self):
+        self.sent = bytearray()
+
+    def sendall(self, data):
+        self.sent += data
+
+
+class TestSendBuffers(unittest.TestCase):
+    """
+    Tests for the scatter-gather send helper shared by clients and servers.
+    """
+
+    BUFFERS = (b"\x00\x00\x00\x05", b"hello", b"\x00\x00\x00\x03", b"abc")
+
+    def test_single_sendmsg_call(self):
+        """
+        Test that buffers fitting in one sendmsg() call go out in one call.
+        """
+        sock = _ChunkedSocket(chunk_size=1024)
+
+        send_buffers(sock, self.BUFFERS)
+
+        self.assertEqual(bytes(sock.sent), b"".join(self.BUFFERS))
+        self.assertEqual(sock.calls, 1)
+
+    def test_partial_sends_resume_where_they_stopped(self):
+        """
+        Test that partial sends, including ones ending mid-buffer and exactly on
+        a buffer boundary, are resumed until every byte is sent in order.
+        """
+        for chunk_size in (1, 3, 4, 9):
+            with self.subTest(chunk_size=chunk_size):
+                sock = _ChunkedSocket(chunk_size)
+
+                send_buffers(sock, self.BUFFERS)
+
+                self.assertEqual(bytes(sock.sent), b"".join(self.BUFFERS))
+
+    def test_fallback_without_sendmsg(self):
+        """
+        Test that sockets without sendmsg() get the buffers joined into one sendall().
+        """
+        sock = _SendallOnlySocket()
+
+        send_buffers(sock, self.BUFFERS)
+
+        self.assertEqual(bytes(sock.sent), b"".join(self.BUFFERS))
+
+
+class TestReceiveFrame(unittest.TestCase):
+    """
+    Tests for reading length-prefixed frames from an untrusted peer.
+    """
+
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+        self.sock.settimeout(2)
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+
+    def test_frame_within_limit(self):
+        """
+        Test that a frame up to max_bytes is returned whole.
+        """
+        self.peer.sendall(b"\x00\x00\x00\x04data")
+
+        self.assertEqual(receive_frame(self.sock, 4), b"data")
+
+    def test_oversized_frame_rejected(self):
+        """
+        Test that a length above max_bytes is rejected from the header alone,
+        without waiting for (or allocating) the announced data.
+        """
+        self.peer.sendall(b"\xf0\x00\x00\x00")
+
+        with self.assertLogs("common", level="ERROR"):
+            self.assertIsNone(receive_frame(self.sock, 1024))
+
+    def test_closed_connection(self):
+        """
+        Test that a connection closed before the header returns None.
+        """
+        self.peer.close()
+
+        self.assertIsNone(receive_frame(self.sock, 1024))
+
+
+def run_tests():
+    """
+    Run the test suite with verbose output.
+    """
+    unittest.main(verbosity=2)
+
+
+if __name__ == "__main__":
+    run_tests()
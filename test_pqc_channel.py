@@ -1,8 +1,14 @@
+import socket
+import struct
 import threading
 import time
 import unittest
+from unittest import mock
+
+from oqs import oqs
 
 from client_pqc import PQCClient
+from common import MAX_MESSAGE_BYTES
 from server_pqc import PQCServer
 
 
@@ -86,7 +92,7 @@ class TestPQCSecureChannel(unittest.TestCase):
     def test_multiple_messages(self):
         """
         Test sending multiple messages in sequence to verify the encryption
-        nonce randomization and message integrity across multiple transmissions
+        nonce sequencing and message integrity across multiple transmissions
         in a post-quantum context.
         """
         server = None
@@ -154,6 +160,239 @@ class TestPQCSecureChannel(unittest.TestCase):
         )
         self.assertFalse(client.connected, "Client should not be marked as connected")
 
+    def _loopback(self, message_event):
+        """
+        Create an activated server and a client joined to it by a socketpair,
+        with no listening socket involved.
+        """
+        server = PQCServer(message_received_event=message_event)
+        server.activate()
+        server_end, client_end = socket.socketpair()
+        server.serve_connection(server_end)
+        return server, PQCClient(sock=client_end)
+
+    def test_socketpair_connection(self):
+        """
+        Test serving a socketpair connection through serve_connection(): the
+        handshake completes and each message round-trips under the next
+        counter nonce.
+        """
+        message_event = threading.Event()
+        server, client = self._loopback(message_event)
+
+        try:
+            self.assertTrue(client.connect(), "Client should connect over a socketpair")
+
+            for count, msg in enumerate(["one", "two", "three"], start=1):
+                message_event.clear()
+                self.assertTrue(client.send_message(msg), f"Should send: {msg}")
+                self.assertTrue(
+                    message_event.wait(timeout=3),
+                    f"Server should receive message within timeout: {msg}",
+                )
+                self.assertEqual(server.last_received_message, msg)
+                self.assertEqual(
+                    client._send_counter,
+                    count,
+                    "Each message should use the next counter nonce",
+                )
+
+        finally:
+            client.close()
+            server.stop()
+
+    def test_replayed_or_reordered_nonce_rejected(self):
+        """
+        Test that the server drops the connection when a message repeats an
+        earlier counter nonce (replay) or skips ahead of the next one (reorder).
+        """
+        for counter in (0, 5):
+            with self.subTest(counter=counter):
+                message_event = threading.Event()
+                server, client = self._loopback(message_event)
+
+                try:
+                    self.assertTrue(client.connect(), "Client should connect")
+                    self.assertTrue(client.send_message("first"))
+                    self.assertTrue(message_event.wait(timeout=3))
+                    message_event.clear()
+
+                    # A valid frame under the session key, but with the wrong counter
+                    nonce = bytes(4) + struct.pack(">Q", counter)
+                    ciphertext = client.aesgcm.encrypt(nonce, b"forged", None)
+                    client.client_socket.sendall(
+                        struct.pack(">I", len(ciphertext)) + nonce + ciphertext
+                    )
+
+                    # The server closes the connection instead of accepting it
+                    client.client_socket.settimeout(3)
+                    self.assertEqual(client.client_socket.recv(1), b"")
+                    self.assertFalse(message_event.is_set())
+                    self.assertEqual(server.last_received_message, "first")
+
+                finally:
+                    client.close()
+                    server.stop()
+
+    def test_listen_on_ephemeral_port(self):
+        """
+        Test that listen() with port 0 binds a free port and stores it in
+        server.port for clients to connect to.
+        """
+        server = PQCServer(host="127.0.0.1", port=0)
+        server_thread = None
+        client = None
+
+        try:
+            server.listen()
+            self.assertNotEqual(server.port, 0, "Server should record the bound port")
+
+            server_thread = threading.Thread(target=server.start, daemon=True)
+            server_thread.start()
+
+            client = PQCClient(host="127.0.0.1", port=server.port)
+            self.assertTrue(client.connect(), "Client should connect to the bound port")
+
+        finally:
+            if client:
+                client.close()
+            server.stop()
+            if server_thread:
+                server_thread.join(timeout=2.0)
+
+    def test_stop_wakes_accept_loop(self):
+        """
+        Test that stop() wakes a running accept loop through the self-pipe at once,
+        closes the listening socket, and that listen() re-arms the server.
+        """
+        server = PQCServer(host="127.0.0.1", port=0)
+        server.listen()
+        port = server.port
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server_thread.start()
+        while not server.running and server_thread.is_alive():
+            time.sleep(0.001)
+
+        started = time.monotonic()
+        server.stop()
+        server_thread.join(timeout=2.0)
+        self.assertFalse(server_thread.is_alive(), "Accept loop should exit")
+        self.assertLess(
+            time.monotonic() - started, 0.5, "stop() should not wait for a poll timeout"
+        )
+        self.assertIsNone(server.server_socket, "Listening socket should be closed")
+
+        # Restart on the same port
+        client = None
+        try:
+            server.listen()
+            self.assertEqual(server.port, port)
+            server_thread = threading.Thread(target=server.start, daemon=True)
+            server_thread.start()
+
+            client = PQCClient(host="127.0.0.1", port=port)
+            self.assertTrue(client.connect(), "Restarted server should accept clients")
+
+        finally:
+            if client:
+                client.close()
+            server.stop()
+            server_thread.join(timeout=2.0)
+
+    def test_stop_before_start(self):
+        """
+        Test that a stop() issued before the accept thread reaches start() is not
+        lost: start() returns at once instead of binding and serving again.
+        """
+        server = PQCServer(host="127.0.0.1", port=0)
+        server.listen()
+        server_thread = threading.Thread(target=server.start, daemon=True)
+        server.stop()
+        server_thread.start()
+        server_thread.join(timeout=2.0)
+
+        self.assertFalse(server_thread.is_alive(), "start() should return at once")
+        self.assertFalse(server.running, "Server should stay stopped")
+        self.assertIsNone(server.server_socket, "start() should not bind again")
+
+    def test_oversized_handshake_frame_rejected(self):
+        """
+        Test that the server drops a connection announcing a handshake frame
+        longer than the key it expects, before reading or allocating it.
+        """
+        server = PQCServer()
+        server.activate()
+        server_end, client_end = socket.socketpair()
+        server.serve_connection(server_end)
+
+        try:
+            client_end.sendall(struct.pack(">I", 0xF0000000))
+
+            # Anything the server sent first is drained, then the connection closes
+            client_end.settimeout(2)
+            while client_end.recv(65536):
+                pass
+
+        finally:
+            client_end.close()
+            server.stop()
+
+    def test_oversized_message_rejected(self):
+        """
+        Test that the client refuses to send a message over MAX_MESSAGE_BYTES
+        and that the server drops a connection announcing one.
+        """
+        message_event = threading.Event()
+        server, client = self._loopback(message_event)
+
+        try:
+            self.assertTrue(client.connect(), "Client should connect")
+            self.assertFalse(
+                client.send_message("x" * (MAX_MESSAGE_BYTES + 1)),
+                "Client should refuse a message over the limit",
+            )
+
+            client.client_socket.sendall(struct.pack(">I", 0xF0000000))
+            client.client_socket.settimeout(2)
+            self.assertEqual(client.client_socket.recv(1), b"")
+            self.assertFalse(message_event.is_set())
+
+        finally:
+            client.disconnect()
+            server.stop()
+
+    def test_stop_frees_pqc_contexts(self):
+        """
+        Test that stop() frees the server's idle liboqs contexts at once, and a
+        set still in use when it ran once its handshake releases it.
+        """
+        server = PQCServer()
+        server.activate()
+        freed = []
+
+        def record_free(context):
+            freed.append(context)
+
+        with mock.patch.object(
+            oqs.KeyEncapsulation, "free", autospec=True, side_effect=record_free
+        ), mock.patch.object(
+            oqs.Signature, "free", autospec=True, side_effect=record_free
+        ):
+            # One set mid-handshake and one returned to the pool
+            busy_kem, busy_sig, _ = busy = server._checkout_contexts()
+            idle_kem, idle_sig, _ = idle = server._checkout_contexts()
+            server._release_contexts(idle)
+
+            server.stop()
+
+            self.assertEqual(server._contexts, [])
+            self.assertEqual(server._idle_contexts, [])
+            self.assertEqual(freed, [idle_kem, idle_sig])
+
+            server._release_contexts(busy)
+
+            self.assertEqual(freed, [idle_kem, idle_sig, busy_kem, busy_sig])
+
 
 def run_tests():
     """
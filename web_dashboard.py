@@ -6,6 +6,7 @@ from __future__ import annotations
 import json
 import logging
 import os
+import threading
 
 from flask import Flask, render_template
 from flask_sock import Sock
@@ -18,6 +19,31 @@ sock = Sock(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("crypto-performance-simulator")
 
+# Benchmarks already run their crypto in worker processes; this only keeps
+# runs from different clients from competing for CPUs and skewing timings
+_BENCHMARK_LOCK = threading.Lock()
+
+# Progress frames are sent once per handshake, so skip building a dict and
+# running the JSON encoder for each one. Mode names are the fixed labels from
+# benchmark.MODE_LABELS and need no escaping.
+_PROGRESS_FRAME = '{"type":"progress","mode":"%s","iteration":%d,"total":%d}'
+
+_VALID_MODES = frozenset(("classical", "pqc", "hybrid"))
+
+# Fixed error frames, encoded once (as text: the browser parses them as strings)
+_ERR_BAD_JSON = json.dumps(
+    {"type": "error", "message": "Invalid request format. Expected JSON."}
+)
+_ERR_BAD_MODES = json.dumps(
+    {
+        "type": "error",
+        "message": "No valid modes selected. Choose from: classical, pqc, hybrid",
+    }
+)
+_STATUS_QUEUED = json.dumps(
+    {"type": "status", "message": "Waiting for another benchmark to finish..."}
+)
+
 
 @app.route("/")
 def index() -> str:
@@ -48,16 +74,7 @@ def benchmark_socket(ws) -> None:
     def progress_callback(mode: str, iteration: int, total: int) -> None:
         """Send progress updates to client."""
         try:
-            ws.send(
-                json.dumps(
-                    {
-                        "type": "progress",
-                        "mode": mode,
-                        "iteration": iteration,
-                        "total": total,
-                    }
-                )
-            )
+            ws.send(_PROGRESS_FRAME % (mode, iteration, total))
         except Exception as exc:
             logger.warning(f"Failed to send progress update: {exc}")
 
@@ -72,14 +89,7 @@ def benchmark_socket(ws) -> None:
                 logger.info(f"Received benchmark request: {request}")
             except json.JSONDecodeError as exc:
                 logger.error(f"Invalid JSON payload: {exc}")
-                ws.send(
-                    json.dumps(
-                        {
-                            "type": "error",
-                            "message": "Invalid request format. Expected JSON."
-                        }
-                    )
-                )
+                ws.send(_ERR_BAD_JSON)
                 continue
 
             # Extract parameters with defaults
@@ -88,18 +98,11 @@ def benchmark_socket(ws) -> None:
             packet_loss = float(request.get("packetLoss", 0.0))
 
             # Validate modes
-            valid_modes = {"classical", "pqc", "hybrid"}
-            modes = [m.lower() for m in modes if m.lower() in valid_modes]
+            lowered = [m.lower() for m in modes]
+            modes = [m for m in lowered if m in _VALID_MODES]
             
             if not modes:
-                ws.send(
-                    json.dumps(
-                        {
-                            "type": "error",
-                            "message": "No valid modes selected. Choose from: classical, pqc, hybrid"
-                        }
-                    )
-                )
+                ws.send(_ERR_BAD_MODES)
                 continue
 
             logger.info(
@@ -108,13 +111,23 @@ def benchmark_socket(ws) -> None:
             )
 
             try:
-                # Run the benchmark with real-time progress
-                results = run_all_benchmarks(
-                    modes_to_run=modes,
-                    latency_ms=latency,
-                    packet_loss_percent=packet_loss,
-                    progress_callback=progress_callback,
-                )
+                # Tell the client it is queued instead of leaving it on
+                # "Initializing..." while another run holds the lock
+                if not _BENCHMARK_LOCK.acquire(blocking=False):
+                    logger.info("Waiting for another benchmark to finish")
+                    ws.send(_STATUS_QUEUED)
+                    _BENCHMARK_LOCK.acquire()
+
+                # Run the benchmark with real-time progress, one at a time
+                try:
+                    results = run_all_benchmarks(
+                        modes_to_run=modes,
+                        latency_ms=latency,
+                        packet_loss_percent=packet_loss,
+                        progress_callback=progress_callback,
+                    )
+                finally:
+                    _BENCHMARK_LOCK.release()
                 
                 # Send final results
                 ws.send(json.dumps({"type": "result", "data": results}))
@@ -136,6 +149,29 @@ def benchmark_socket(ws) -> None:
         logger.info("🔌 WebSocket connection closed")
 
 
+def run_gunicorn(host: str, port: int) -> None:
+    """
+    Serve the app with gunicorn (used when FLASK_ENV=production).
+
+    A single process with gunicorn's threaded worker: each WebSocket holds a
+    thread for its lifetime, and more worker processes would only let several
+    benchmarks compete for CPUs, defeating _BENCHMARK_LOCK.
+    """
+    from gunicorn.app.base import BaseApplication
+
+    class DashboardApplication(BaseApplication):
+        def load_config(self) -> None:
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", int(os.environ.get("WEB_THREADS", 32)))
+
+        def load(self) -> Flask:
+            return app
+
+    DashboardApplication().run()
+
+
 def main() -> None:
     """Launch the simulator server."""
     port = int(os.environ.get("PORT", 8080))
@@ -147,7 +183,10 @@ def main() -> None:
     )
     logger.info("Press Ctrl+C to stop the server")
     
-    app.run(host=host, port=port, debug=False)
+    if os.environ.get("FLASK_ENV") == "production":
+        run_gunicorn(host, port)
+    else:
+        app.run(host=host, port=port, debug=False)
 
 
 if __name__ == "__main__":